@@ -3,6 +3,7 @@ from dotenv import load_dotenv
 from utils.whitelist import *
 from utils.onedrive import *
 from utils.formatters import *
+from utils.search import SearchIndex
 import bcrypt
 import os
 import io
@@ -20,6 +21,8 @@ tenant_id = os.getenv("AZURE_TENANT_ID")
 scopes = ["User.Read", "Files.Read", "Files.ReadWrite"]
 
 dropbox_name = os.getenv("DROPBOX_NAME", "Dropbox")
+# empty means default, and don't let the crawler hammer Graph
+search_refresh_interval = max(60, int(os.getenv("SEARCH_REFRESH_INTERVAL") or 300))
 
 app = Flask(__name__)
 acl = ACL.from_yaml(open("rules.yml", "r", encoding="utf-8"))
@@ -35,6 +38,9 @@ except Exception as e:
     print(f"Authentication failed: {e}")
     exit(1)
 
+search_index = SearchIndex(client, search_refresh_interval)
+search_index.start()
+
 app.jinja_env.filters["human_timestamp"] = human_timestamp
 app.jinja_env.filters["human_filesize"] = human_filesize
 
@@ -131,6 +137,26 @@ def dropbox():
 def auth():
     return render_template("auth.html")
 
+@app.route("/_/search")
+def search():
+    principal = get_principal()
+    principal_id = principal.name if hasattr(principal, 'name') else "everyone"
+
+    query = request.args.get("q", "")
+    # not can_access_cached, a single query would flush its entries
+    files, truncated = search_index.search(query, principal_id, lambda path: acl.can_access(principal, path))
+    refreshed_at = search_index.refreshed_at
+
+    return render_template(
+        "search.html",
+        query=query,
+        files=files,
+        truncated=truncated,
+        indexed=len(search_index.snapshot),
+        refreshed_at=int(refreshed_at) if refreshed_at else None,
+        stale=search_index.is_stale()
+    )
+
 @lru_cache(maxsize=256)
 def can_access_cached(principal_id: str, path: str):
     """Cache ACL access decisions to avoid repeated lookups"""
@@ -2,7 +2,7 @@ import msal
 import requests
 import os
 from datetime import datetime
-from typing import List
+from typing import List, Optional, Tuple
 from utils.formatters import *
 from urllib.parse import quote
 
@@ -154,8 +154,27 @@ class Client:
         else:
             url = f"{self.graph_base}/me/drive/items/{item_id}/children"
 
-        res = self._request("get", url)
-        return [File.from_request(item) for item in res.json().get("value", [])]
+        files = []
+
+        # Graph pages large listings, follow nextLink until the end
+        while url:
+            data = self._request("get", url).json()
+            files.extend(File.from_request(item) for item in data.get("value", []))
+            url = data.get("@odata.nextLink")
+
+        return files
+
+    def get_delta(self, url: Optional[str] = None) -> Tuple[List[dict], Optional[str], Optional[str]]:
+        """
+        Fetch one page of the drive delta feed, starting from scratch when url is None.
+        Returns (items, next_link, delta_link). Items are raw driveItems because
+        deleted ones only carry an id.
+        """
+        if url is None:
+            url = f"{self.graph_base}/me/drive/root/delta"
+
+        data = self._request("get", url).json()
+        return data.get("value", []), data.get("@odata.nextLink"), data.get("@odata.deltaLink")
 
     def get_file_by_id(self, item_id) -> File:
         url = f"{self.graph_base}/me/drive/items/{item_id}"
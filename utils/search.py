@@ -0,0 +1,384 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from utils.onedrive import Client, File
+from utils.formatters import parse_date
+import requests
+import threading
+import time
+
+# Upper bound of uncached ACL checks a single query may run
+MAX_CHECKS = 10000
+
+# First delay between two failed refreshes, doubled up to the refresh interval
+RETRY_DELAY = 5
+
+# (path, name, size, ctime, is_folder)
+Entry = Tuple[str, str, int, int, bool]
+
+
+def trigrams(text: str):
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+
+class Snapshot:
+    """Immutable, array-based view of every indexed item"""
+
+    def __init__(self, entries: Iterable[Entry]):
+        self.paths: List[str] = []
+        self.names: List[str] = []
+        self.sizes = array("q")
+        self.ctimes = array("q")
+        self.folders = bytearray()
+
+        # trigram -> sorted item indexes (lowercased name)
+        self.postings: Dict[str, array] = {}
+
+        # every lowercased name joined by newlines, for queries shorter than a trigram
+        self.offsets = array("I")
+        offset = 0
+        lowered = []
+
+        for i, (path, name, size, ctime, is_folder) in enumerate(entries):
+            self.paths.append(path)
+            self.names.append(name)
+            self.sizes.append(size or 0)
+            self.ctimes.append(ctime or 0)
+            self.folders.append(is_folder)
+
+            name = name.lower()
+            lowered.append(name)
+            self.offsets.append(offset)
+            offset += len(name) + 1
+
+            for gram in trigrams(name):
+                posting = self.postings.get(gram)
+                if posting is None:
+                    posting = self.postings[gram] = array("I")
+                posting.append(i)
+
+        self.blob = "\n".join(lowered)
+
+        # lowercased names sorted alphabetically, to rank exact and prefix matches first
+        order = sorted(range(len(lowered)), key=lowered.__getitem__)
+        self.sorted_names = [lowered[i] for i in order]
+        self.sorted_order = array("I", order)
+
+        # principal -> per item ACL decision (0 unknown, 1 allowed, 2 denied)
+        self._acl: Dict[str, bytearray] = {}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def get_file(self, i: int) -> File:
+        ctime = datetime.fromtimestamp(self.ctimes[i]) if self.ctimes[i] else None
+        return File(self.names[i], None, self.sizes[i], self.paths[i], None, bool(self.folders[i]), ctime, None)
+
+    def _prefix_candidates(self, query: str):
+        # the exact name sorts first, then every name starting with it
+        pos = bisect_left(self.sorted_names, query)
+        while pos < len(self.sorted_names) and self.sorted_names[pos].startswith(query):
+            yield self.sorted_order[pos]
+            pos += 1
+
+    def _scan_candidates(self, query: str):
+        pos = self.blob.find(query)
+        while pos != -1:
+            i = bisect_right(self.offsets, pos) - 1
+            yield i
+
+            # skip the rest of this name
+            if i + 1 == len(self.offsets):
+                break
+            pos = self.blob.find(query, self.offsets[i + 1])
+
+    def _trigram_candidates(self, query: str):
+        postings = []
+        for gram in trigrams(query):
+            posting = self.postings.get(gram)
+            if posting is None:
+                return
+            postings.append(posting)
+
+        postings.sort(key=len)
+        smallest, others = postings[0], postings[1:]
+
+        for i in smallest:
+            for posting in others:
+                pos = bisect_left(posting, i)
+                if pos == len(posting) or posting[pos] != i:
+                    break
+            else:
+                # trigrams may match out of order, confirm the substring
+                if query in self.names[i].lower():
+                    yield i
+
+    def search(self, query: str, principal_id: str, can_access: Callable[[str], bool], limit: int = 100) -> Tuple[List[File], bool]:
+        """
+        Return items whose name contains query, case-insensitively, that the principal can access.
+        Exact and prefix matches come first. The flag is True when matches were left out,
+        either past the limit or because the query ran out of ACL checks.
+        """
+        query = query.strip().lower()
+        if not query or "\n" in query:
+            return [], False
+
+        if len(query) < 3:
+            substring = self._scan_candidates(query)
+        else:
+            substring = self._trigram_candidates(query)
+
+        allowed = self._acl.get(principal_id)
+        if allowed is None:
+            allowed = self._acl[principal_id] = bytearray(len(self))
+
+        results = []
+        checks = 0
+
+        for ranked, candidates in enumerate((self._prefix_candidates(query), substring)):
+            for i in candidates:
+                # prefix matches were already listed
+                if ranked and self.blob.startswith(query, self.offsets[i]):
+                    continue
+
+                if allowed[i] == 0:
+                    if checks >= MAX_CHECKS:
+                        return results, True
+                    checks += 1
+                    allowed[i] = 1 if can_access(self.paths[i]) else 2
+
+                if allowed[i] == 2:
+                    continue
+
+                if len(results) >= limit:
+                    return results, True
+                results.append(self.get_file(i))
+
+        return results, False
+
+
+class SearchIndex:
+    def __init__(self, client: Client, refresh_interval: int = 300):
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self.snapshot = Snapshot([])
+        self.refreshed_at: Optional[float] = None
+
+        # item id -> (parent id, name, size, ctime, is_folder), kept in sync by the delta feed
+        self._items: Dict[str, Tuple[Optional[str], str, int, int, bool]] = {}
+        self._root_id: Optional[str] = None
+        self._delta_link: Optional[str] = None
+        self._thread = None
+
+    def _apply(self, item: dict):
+        if "deleted" in item:
+            self._items.pop(item["id"], None)
+            return
+
+        if "root" in item:
+            self._root_id = item["id"]
+            return
+
+        parent_ref = item.get("parentReference") or {}
+        created = item.get("createdDateTime")
+
+        self._items[item["id"]] = (
+            parent_ref.get("id"),
+            item["name"],
+            item.get("size", 0),
+            int(parse_date(created).timestamp()) if created else 0,
+            "folder" in item
+        )
+
+    def _resolve(self, item_id: str, paths: Dict[str, Optional[str]]) -> Optional[str]:
+        # delta items don't carry a path, rebuild it from the parent ids
+        chain = []
+        while item_id not in paths:
+            entry = self._items.get(item_id)
+            if entry is None or len(chain) > len(self._items):
+                paths[item_id] = None
+                break
+            chain.append(item_id)
+            item_id = entry[0]
+
+        path = paths[item_id]
+        for child_id in reversed(chain):
+            path = None if path is None else path + "/" + self._items[child_id][1]
+            paths[child_id] = path
+
+        return path
+
+    def _build(self) -> Snapshot:
+        paths: Dict[str, Optional[str]] = {self._root_id: ""}
+        entries = []
+        orphans = []
+
+        for item_id, (_, name, size, ctime, is_folder) in self._items.items():
+            path = self._resolve(item_id, paths)
+            if path is None:
+                orphans.append(item_id)
+                continue
+            entries.append((path, name, size, ctime, is_folder))
+
+        # children of deleted folders aren't always reported as deleted
+        if self._root_id is not None:
+            for item_id in orphans:
+                del self._items[item_id]
+
+        return Snapshot(entries)
+
+    def sync(self):
+        """Pull changes from the drive delta feed and swap in a fresh snapshot"""
+        url = self._delta_link
+        if url is None:
+            # full enumeration, don't keep leftovers from an interrupted one
+            self._items.clear()
+            self._root_id = None
+
+        changed = False
+
+        try:
+            while True:
+                items, next_link, delta_link = self.client.get_delta(url)
+                for item in items:
+                    self._apply(item)
+                changed = changed or bool(items)
+
+                if delta_link:
+                    break
+                if not next_link:
+                    raise Exception("Delta response has neither a nextLink nor a deltaLink")
+                url = next_link
+        except requests.HTTPError as e:
+            # expired delta token, Graph asks for a full resync
+            if self._delta_link is not None and e.response is not None and e.response.status_code == 410:
+                self._delta_link = None
+                return self.sync()
+            raise
+
+        if changed or self.refreshed_at is None:
+            self.snapshot = self._build()
+
+        self._delta_link = delta_link
+        self.refreshed_at = time.time()
+
+    def is_stale(self) -> bool:
+        return self.refreshed_at is None or time.time() - self.refreshed_at > 2 * self.refresh_interval
+
+    def _run(self):
+        delay = RETRY_DELAY
+
+        while True:
+            try:
+                started = time.monotonic()
+                self.sync()
+                print(f"Search index refreshed: {len(self.snapshot)} items in {time.monotonic() - started:.1f}s")
+            except Exception as e:
+                print(f"Search index refresh failed: {e}, retrying in {delay}s")
+                time.sleep(delay)
+                delay = min(delay * 2, self.refresh_interval)
+                continue
+
+            delay = RETRY_DELAY
+            time.sleep(self.refresh_interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="search-crawler", daemon=True)
+            self._thread.start()
+
+    def search(self, query: str, principal_id: str, can_access: Callable[[str], bool], limit: int = 100) -> Tuple[List[File], bool]:
+        return self.snapshot.search(query, principal_id, can_access, limit)
+
+
+if __name__ == "__main__":
+    class StubClient:
+        def __init__(self):
+            self.pages = []
+
+        def get_delta(self, url=None):
+            items = self.pages.pop(0) if self.pages else []
+            return items, None, "delta"
+
+    def item(id, name, parent, folder=False):
+        data = {"id": id, "name": name, "parentReference": {"id": parent}}
+        if folder:
+            data["folder"] = {}
+        return data
+
+    def test_check(index:SearchIndex, query:str, expected:List[str], principal="everyone", can_access=lambda path: True):
+        files, _ = index.search(query, principal, can_access)
+        paths = sorted(file.path for file in files)
+        print(f"  {'✅' if paths == sorted(expected) else '❌'} {query!r} -> {paths}")
+
+    client = StubClient()
+    index = SearchIndex(client)
+
+    client.pages.append([
+        {"id": "root", "name": "root", "root": {}},
+        item("a", "A", "root", folder=True),
+        item("b", "B", "a", folder=True),
+        item("old", "old.txt", "b"),
+        item("reports", "Reports", "root", folder=True),
+        item("q1", "q1.pdf", "reports"),
+        item("pub", "public", "root", folder=True),
+        item("doc", "report.doc", "pub"),
+    ])
+    index.sync()
+
+    print("Initial sync:")
+    test_check(index, "old", ["/A/B/old.txt"])
+    test_check(index, "rep", ["/Reports", "/public/report.doc"])
+    test_check(index, "re", ["/Reports", "/public/report.doc"])
+    test_check(index, "q", ["/Reports/q1.pdf"])
+    test_check(index, "REPORT", ["/public/report.doc"], "anonymous", lambda path: path.startswith("/public"))
+    test_check(index, "zzz", [])
+
+    # a deep rename only reports the renamed item, without its path
+    client.pages.append([item("old", "new.txt", "b")])
+    index.sync()
+
+    print("Deep rename:")
+    test_check(index, "new", ["/A/B/new.txt"])
+    test_check(index, "old", [])
+
+    # a deleted folder may not report its children
+    client.pages.append([{"id": "a", "deleted": {}}])
+    index.sync()
+
+    print("Folder deletion:")
+    test_check(index, "new", [])
+    print(f"  {'✅' if 'old' not in index._items else '❌'} orphans pruned")
+
+    client.pages.append([
+        item("docs", "docs", "root", folder=True),
+        item("d1", "old report", "docs"),
+        item("d2", "report", "docs"),
+        item("d3", "report 2024", "docs"),
+    ])
+    index.sync()
+
+    print("Ranking:")
+    files, truncated = index.search("report", "everyone", lambda path: True)
+    names = [file.name for file in files]
+    expected = ["report", "report 2024", "report.doc", "Reports", "old report"]
+    print(f"  {'✅' if names == expected and not truncated else '❌'} 'report' -> {names}")
+
+    files, truncated = index.search("report", "everyone", lambda path: True, limit=2)
+    print(f"  {'✅' if len(files) == 2 and truncated else '❌'} limit=2 -> {len(files)} results, truncated={truncated}")
+
+    # only uncached ACL checks count against the cap, repeating a query goes further
+    client.pages.append([item("priv", "private", "root", folder=True)] +
+                        [item(f"p{n}", f"{n}.pdf", "priv") for n in range(20000)] +
+                        [item("x", "x.pdf", "pub")])
+    index.sync()
+
+    print("ACL check cap:")
+    public_only = lambda path: path.startswith("/public")
+    files, truncated = index.search("pdf", "anonymous", public_only)
+    print(f"  {'✅' if not files and truncated else '❌'} first query -> {len(files)} results, truncated={truncated}")
+    for _ in range(3):
+        files, truncated = index.search("pdf", "anonymous", public_only)
+    paths = [file.path for file in files]
+    print(f"  {'✅' if paths == ['/public/x.pdf'] and not truncated else '❌'} repeated query -> {paths}, truncated={truncated}")